@@ -1,10 +1,18 @@
 import socket
-import json
+import base64
+import concurrent.futures
+import functools
+import math
 import os
+import queue
+import threading
 import uuid
+import warnings
 import numpy as np
+import orjson
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 
 import wandb
@@ -17,72 +25,175 @@ PORT = 50007
 # ==============================
 ENTITY  = "lsj77205619"          # 필요하면 바꿔도 됨
 PROJECT = "IndustryDQN_Factory"  # 새 프로젝트 이름 (원하면 수정)
-
-# 예전 설정 잔재 제거
-os.environ.pop("WANDB_ENTITY", None)
-os.environ.pop("WANDB_PROJECT", None)
-os.environ.pop("WANDB_BASE_URL", None)
-os.environ["WANDB_RESUME"] = "never"
-os.environ["WANDB_MODE"]   = "online"
-
-run = wandb.init(
-    project=PROJECT,
-    name=f"IndustryDQN_{uuid.uuid4().hex[:8]}",
-    resume="never",
-    id=str(uuid.uuid4()),
-    mode="online",
-)
-
-# 축 정의
-wandb.define_metric("env_step")                 # per-step
-wandb.define_metric("episode")                  # per-episode
-wandb.define_metric("train/*", step_metric="env_step")
-wandb.define_metric("episodic/*", step_metric="episode")
-wandb.define_metric("buffer/*", step_metric="episode")
+WANDB_MODE = "online"            # 개발/테스트 중엔 "offline"
 
 # 체크포인트 설정
 CHECKPOINT_DIR = "./checkpoints"
-os.makedirs(CHECKPOINT_DIR, exist_ok=True)
 CHECKPOINT_INTERVAL = 500  # step마다 저장 간격
 
 
+def init_wandb():
+    """
+    W&B run 생성 + metric 축 정의.
+    import 시점이 아니라 main()에서 한 번만 호출 (import만 할 때는 네트워크 연결 없음)
+    """
+    # 예전 설정 잔재 제거
+    os.environ.pop("WANDB_ENTITY", None)
+    os.environ.pop("WANDB_PROJECT", None)
+    os.environ.pop("WANDB_BASE_URL", None)
+    os.environ["WANDB_RESUME"] = "never"
+    os.environ["WANDB_MODE"]   = WANDB_MODE
+
+    wandb.setup()
+    run = wandb.init(
+        project=PROJECT,
+        name=f"IndustryDQN_{uuid.uuid4().hex[:8]}",
+        resume="never",
+        id=str(uuid.uuid4()),
+        mode=WANDB_MODE,
+    )
+
+    # 축 정의
+    wandb.define_metric("env_step")                 # per-step
+    wandb.define_metric("episode")                  # per-episode
+    wandb.define_metric("train/*", step_metric="env_step")
+    wandb.define_metric("episodic/*", step_metric="episode")
+    wandb.define_metric("buffer/*", step_metric="episode")
+    return run
+
+
+# ==============================
+#  W&B 비동기 로깅
+# ==============================
+class WandbLogger:
+    """
+    per-step wandb.log 와 콘솔 출력을 백그라운드 스레드에서 처리.
+    - log(): 큐에 넣고 바로 반환 (학습 루프에서 네트워크 I/O 제거)
+             값으로 텐서를 넣어도 됨 (float 변환 = GPU 동기화도 백그라운드에서)
+    - log_text(): per-step 콘솔 출력도 같은 스레드에서 (순서 유지)
+    - flush(): 큐가 빌 때까지 대기 (episode 요약처럼 순서가 중요한 동기 로깅 전에 호출)
+    큐가 가득 차면 (W&B가 밀리는 경우) 새 항목은 버리고 dropped 로 센다.
+    """
+    def __init__(self, maxsize: int = 1024):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="wandb-logger", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if isinstance(item, str):
+                    print(item)
+                else:
+                    wandb.log({k: (v.item() if torch.is_tensor(v) else v) for k, v in item.items()})
+            except Exception as e:
+                print(f"[PY] wandb.log error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def log(self, row: dict):
+        self._put(row)
+
+    def log_text(self, line: str):
+        self._put(line)
+
+    def flush(self):
+        self._queue.join()
+
+
 # ==============================
 #  Replay Buffer
 # ==============================
 class ReplayBuffer:
-    def __init__(self, capacity: int, state_dim: int):
+    """
+    transition 저장소. 모든 필드를 device(GPU 학습이면 GPU) 위 텐서로 보관해서
+    sample()은 device 안에서 gather만 하고 학습 step마다 H2D 복사가 없다.
+    """
+    def __init__(self, capacity: int, state_dim: int, device: str = "cpu"):
+        # capacity는 2의 거듭제곱으로 올림 -> wrap-around를 % 대신 & mask 로
+        capacity = 1 << (capacity - 1).bit_length()
         self.capacity = capacity
+        self._mask = capacity - 1
         self.state_dim = state_dim
+        self.device = torch.device(device)
+
+        def zeros(shape, dtype):
+            return torch.zeros(shape, dtype=dtype, device=self.device)
 
-        self.states = np.zeros((capacity, state_dim), dtype=np.float32)
-        self.actions = np.zeros(capacity, dtype=np.int64)
-        self.rewards = np.zeros(capacity, dtype=np.float32)
-        self.next_states = np.zeros((capacity, state_dim), dtype=np.float32)
-        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.states = zeros((capacity, state_dim), torch.float32)
+        self.actions = zeros(capacity, torch.int64)
+        self.rewards = zeros(capacity, torch.float32)
+        self.next_states = zeros((capacity, state_dim), torch.float32)
+        self.dones = zeros(capacity, torch.float32)
 
         self.pos = 0
         self.size = 0
 
-    def push(self, s, a, r, s_next, done):
-        idx = self.pos
-        self.states[idx] = s
-        self.actions[idx] = a
-        self.rewards[idx] = r
-        self.next_states[idx] = s_next
-        self.dones[idx] = float(done)
-
-        self.pos = (self.pos + 1) % self.capacity
-        self.size = min(self.size + 1, self.capacity)
+        # sample()용 index / batch 버퍼 (batch_size가 바뀔 때만 재할당)
+        self._batch_size = None
+        self._idxs = None
+        self._batch = None
+
+    def push_many(self, S, A, R, S2, D):
+        """
+        N개의 transition을 한 번에 저장.
+        - S, S2: (N, state_dim) / A, R, D: (N,)
+        - wrap-around 인덱스는 한 번만 계산하고, 필드별로 H2D 복사 한 번씩
+        """
+        n = len(A)
+        if n == 0:
+            return
+        idx = ((self.pos + torch.arange(n, dtype=torch.int64)) & self._mask).to(self.device)
+
+        def to_dev(x, dtype):
+            return torch.as_tensor(x, dtype=dtype, device=self.device)
+
+        self.states.index_copy_(0, idx, to_dev(S, torch.float32))
+        self.actions.index_copy_(0, idx, to_dev(A, torch.int64))
+        self.rewards.index_copy_(0, idx, to_dev(R, torch.float32))
+        self.next_states.index_copy_(0, idx, to_dev(S2, torch.float32))
+        self.dones.index_copy_(0, idx, to_dev(D, torch.float32))
+
+        self.pos = (self.pos + n) & self._mask
+        self.size = min(self.size + n, self.capacity)
+
+    def _alloc_batch(self, batch_size):
+        def empty(shape, dtype):
+            return torch.empty(shape, dtype=dtype, device=self.device)
+
+        self._batch_size = batch_size
+        self._idxs = empty(batch_size, torch.int64)
+        self._batch = dict(
+            states=empty((batch_size, self.state_dim), torch.float32),
+            actions=empty(batch_size, torch.int64),
+            rewards=empty(batch_size, torch.float32),
+            next_states=empty((batch_size, self.state_dim), torch.float32),
+            dones=empty(batch_size, torch.float32),
+        )
 
     def sample(self, batch_size):
-        idxs = np.random.randint(0, self.size, size=batch_size)
-        batch = dict(
-            states=self.states[idxs],
-            actions=self.actions[idxs],
-            rewards=self.rewards[idxs],
-            next_states=self.next_states[idxs],
-            dones=self.dones[idxs],
-        )
+        """
+        batch_size개를 무작위 추출해서 self.device 위의 텐서 dict로 반환.
+        반환되는 텐서들은 재사용되므로 다음 sample() 호출 시 덮어써진다.
+        """
+        if self._batch_size != batch_size:
+            self._alloc_batch(batch_size)
+
+        idxs = torch.randint(0, self.size, (batch_size,), device=self.device, out=self._idxs)
+        batch = self._batch
+        torch.index_select(self.states, 0, idxs, out=batch["states"])
+        torch.index_select(self.actions, 0, idxs, out=batch["actions"])
+        torch.index_select(self.rewards, 0, idxs, out=batch["rewards"])
+        torch.index_select(self.next_states, 0, idxs, out=batch["next_states"])
+        torch.index_select(self.dones, 0, idxs, out=batch["dones"])
         return batch
 
     def __len__(self):
@@ -103,21 +214,65 @@ class QNetwork(nn.Module):
         super().__init__()
         self.state_dim = state_dim
 
-        input_dim = state_dim + 1
         hidden = 256
         hidden2 = 128
 
-        self.net = nn.Sequential(
-            nn.Linear(input_dim, hidden),
-            nn.ReLU(),
-            nn.Linear(hidden, hidden2),
-            nn.ReLU(),
-            nn.Linear(hidden2, 1),
-        )
+        # 첫 Linear(state_dim + 1 -> hidden)를 state / action 두 부분으로 분리
+        # (concat 없이 fc_s(s) + fc_a(a), bias는 fc_s에만)
+        self.fc_s = nn.Linear(state_dim, hidden)
+        self.fc_a = nn.Linear(1, hidden, bias=False)
+        self.fc2 = nn.Linear(hidden, hidden2)
+        self.fc3 = nn.Linear(hidden2, 1)
+
+        # 예전 Linear(state_dim + 1, hidden)와 같은 초기화 범위 유지
+        bound = 1.0 / math.sqrt(state_dim + 1)
+        for p in (self.fc_s.weight, self.fc_s.bias, self.fc_a.weight):
+            nn.init.uniform_(p, -bound, bound)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        # 예전 체크포인트 호환: net = Sequential(Linear(state_dim + 1, hidden), ReLU, Linear, ReLU, Linear)
+        legacy_w = prefix + "net.0.weight"
+        if legacy_w in state_dict:
+            w = state_dict.pop(legacy_w)
+            state_dict[prefix + "fc_s.weight"] = w[:, :self.state_dim]
+            state_dict[prefix + "fc_a.weight"] = w[:, self.state_dim:]
+            state_dict[prefix + "fc_s.bias"] = state_dict.pop(prefix + "net.0.bias")
+            for old, new in (("net.2", "fc2"), ("net.4", "fc3")):
+                for k in ("weight", "bias"):
+                    state_dict[f"{prefix}{new}.{k}"] = state_dict.pop(f"{prefix}{old}.{k}")
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    # ---- 분해된 구조: Q(s, a) = head(encode_state(s) + encode_action(a)) ----
+    def encode_state(self, state):
+        """state: (B, state_dim) -> (B, hidden)"""
+        return self.fc_s(state)
+
+    def encode_action(self, actions):
+        """actions: (A,) 정규화된 float -> (A, hidden)"""
+        return self.fc_a(actions.view(-1, 1))
+
+    def head(self, h):
+        """h: (..., hidden) -> Q: (..., 1)"""
+        h = F.relu(h, inplace=True)
+        h = F.relu(self.fc2(h), inplace=True)
+        return self.fc3(h)
 
     def forward(self, state, action_id):
-        x = torch.cat([state, action_id], dim=1)
-        q = self.net(x)
+        q = self.head(self.encode_state(state) + self.fc_a(action_id))
+        return q
+
+    @torch.jit.export
+    def forward_expanded(self, state, actions):
+        """
+        모든 (state, action) 조합의 Q를 state 복제 없이 계산.
+        - 입력: state: (B, state_dim), actions: (A,)  -> 정규화된 float
+        - 출력: Q: (B, A)
+        큰 첫 층은 state B번 + action A번만 계산하고, (B, A, hidden)은 작은 head만 본다.
+        """
+        hs = self.encode_state(state)          # (B, hidden)
+        ha = self.encode_action(actions)       # (A, hidden)
+        h = hs.unsqueeze(1) + ha.unsqueeze(0)  # (B, A, hidden)
+        q = self.head(h).squeeze(-1)           # (B, A)
         return q
 
 
@@ -135,6 +290,7 @@ class DqnLearner:
         warmup: int = 1_000,
         target_update_interval: int = 1_000,
         device: str = None,
+        compile_net: bool = True,
     ):
         self.state_dim = state_dim
         self.gamma = gamma
@@ -143,116 +299,361 @@ class DqnLearner:
         self.target_update_interval = target_update_interval
 
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.device_type = torch.device(self.device).type
+
+        # CUDA: forward는 BF16 autocast (Adam / master weight는 FP32 유지)
+        # BF16이 안 되는 GPU는 TF32 matmul 로 대신 가속
+        self.use_amp = self.device_type == "cuda" and torch.cuda.is_bf16_supported()
+        if self.device_type == "cuda":
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            # MLP + 고정 shape: cuDNN 알고리즘 탐색/workspace 할당은 이득 없이 오버헤드만 추가
+            torch.backends.cudnn.benchmark = False
+            torch.backends.cudnn.deterministic = False
 
         self.policy_net = QNetwork(state_dim).to(self.device)
         self.target_net = QNetwork(state_dim).to(self.device)
         self.target_net.load_state_dict(self.policy_net.state_dict())
         self.target_net.eval()
+        # target은 soft update로만 바뀌므로 autograd 추적 끔
+        self.target_net.requires_grad_(False)
+
+        # CUDA: policy_net.forward를 torch.compile(reduce-overhead, CUDA graph)로 컴파일
+        # - 학습 batch는 batch_size 고정, 추론 batch는 _bucket()으로 2의 거듭제곱에 맞춰 재컴파일 방지
+        # - target_net은 forward_expanded만 쓰므로 (A가 계속 변함) 컴파일하지 않음
+        # - 컴파일/실행 실패 시 로그를 남기고 eager로 fallback (_policy_forward)
+        self.compiled = compile_net and self.device_type == "cuda" and hasattr(torch, "compile")
+        self._compiled_policy = None
+        if self.compiled:
+            # 원본 policy_net은 eager 그대로 두고 (파라미터 공유) 컴파일본만 따로 보관
+            # (재컴파일 허용 수 recompile_limit은 프로세스 전역 설정이라 main()에서)
+            self._compiled_policy = torch.compile(self.policy_net, mode="reduce-overhead", dynamic=False)
+
+        # 컴파일을 안 쓰면(CPU 등) 추론 경로(predict_q, target 계산)는 TorchScript로
+        # - 스크립트 모듈은 원본과 파라미터를 공유 -> 학습/soft update는 원본 기준 그대로
+        # - 스크립트 실패 시 eager 유지
+        self.policy_infer = self.policy_net
+        if not self.compiled:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", FutureWarning)
+                    self.policy_infer = torch.jit.script(self.policy_net).eval()
+                    self.target_net = torch.jit.script(self.target_net).eval()
+            except Exception as e:
+                print(f"[PY] torch.jit.script 실패, eager 사용: {e}")
+
+        # soft update용 파라미터 리스트 (매 step 재생성 방지)
+        self._target_params = list(self.target_net.parameters())
+        self._policy_params = list(self.policy_net.parameters())
 
         self.optimizer = optim.Adam(self.policy_net.parameters(), lr=lr)
-        self.replay = ReplayBuffer(capacity, state_dim)
+        # ε-greedy용 난수 생성기
+        self.rng = np.random.default_rng()
+        self.replay = ReplayBuffer(capacity, state_dim, device=self.device)
 
         self.train_step_count = 0
         self.last_loss = None
 
         self.known_actions = set()
         self.node_id_scale = 100.0
+        self._scale_inv = 1.0 / self.node_id_scale
+
+        # 정규화된 known_actions 텐서 캐시 (새 action이 들어올 때만 재생성)
+        self._actions_tensor = None
+        self._actions_dirty = True
+
+        # action_request 후보 목록 -> 정규화된 action 텐서 캐시
+        # (같은 후보 목록이 연속/교대로 반복되는 경우가 많음)
+        self._cand_tensor = functools.lru_cache(maxsize=8)(self._build_cand_tensor)
 
         self.tau = 0.005
 
+        # 추론용 state 입력 staging (CUDA면 pinned memory + non_blocking H2D 복사)
+        self._pin_state = None
+        if self.device_type == "cuda":
+            self._pin_state = torch.empty(state_dim, dtype=torch.float32, pin_memory=True)
+            self._pin_state_np = self._pin_state.numpy()
+            self._state_copy_done = torch.cuda.Event()
+
+        # 학습(TrainWorker 스레드)과 추론/저장(소켓 스레드)이 네트워크/replay/staging을 공유
+        # → forward/학습/state_dict 접근은 모두 이 lock 안에서 (CUDA graph 재생도 동시에 하나만)
+        self.lock = threading.Lock()
+
+        # 체크포인트 디스크 쓰기는 백그라운드 스레드 1개에서
+        self._save_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="ckpt"
+        )
+
+        # transition staging: stage_size개씩 모아서 replay에 push_many
+        self.stage_size = 8
+        self._stage_s = np.zeros((self.stage_size, state_dim), dtype=np.float32)
+        self._stage_a = np.zeros(self.stage_size, dtype=np.int64)
+        self._stage_r = np.zeros(self.stage_size, dtype=np.float32)
+        self._stage_s2 = np.zeros((self.stage_size, state_dim), dtype=np.float32)
+        self._stage_d = np.zeros(self.stage_size, dtype=np.float32)
+        self._stage_n = 0
+
         print(f"[PY] DqnLearner 초기화: state_dim={state_dim}, device={self.device}")
 
-    def _to_tensor(self, arr, dtype=torch.float32):
-        return torch.as_tensor(arr, dtype=dtype, device=self.device)
+    def _autocast(self):
+        return torch.autocast(
+            device_type=self.device_type, dtype=torch.bfloat16, enabled=self.use_amp
+        )
+
+    def _policy_forward(self, module, states, actions):
+        """policy Q(s, a): 컴파일본이 있으면 사용, 실패하면 한 번 로그 후 module(eager/TorchScript)로 전환."""
+        if self._compiled_policy is not None:
+            try:
+                return self._compiled_policy(states, actions)
+            except Exception as e:
+                print(f"[PY] torch.compile 실행 실패, eager 사용: {e}")
+                self._compiled_policy = None
+        return module(states, actions)
 
     def _action_to_tensor(self, actions):
-        a = np.array(actions, dtype=np.float32) / self.node_id_scale
-        t = self._to_tensor(a, dtype=torch.float32).unsqueeze(-1)
-        return t
+        # (A,) node_id -> (A, 1) 정규화 텐서 (torch.tensor는 항상 복사하므로 in-place 정규화 안전)
+        t = torch.tensor(actions, dtype=torch.float32, device=self.device)
+        return t.mul_(self._scale_inv).unsqueeze_(-1)
+
+    def flush(self):
+        """staging에 쌓인 transition을 replay buffer로 옮긴다."""
+        n = self._stage_n
+        if n == 0:
+            return
+        self.replay.push_many(
+            self._stage_s[:n],
+            self._stage_a[:n],
+            self._stage_r[:n],
+            self._stage_s2[:n],
+            self._stage_d[:n],
+        )
+        self._stage_n = 0
 
     def observe(self, s, a, r, s_next, done=False):
-        self.replay.push(s, a, r, s_next, done)
-        self.known_actions.add(int(a))
-
-        loss_val = None
-        if len(self.replay) >= self.warmup:
-            loss_val = self._train_step()
-        return loss_val
+        with self.lock:
+            k = self._stage_n
+            self._stage_s[k] = s
+            self._stage_a[k] = a
+            self._stage_r[k] = r
+            self._stage_s2[k] = s_next
+            self._stage_d[k] = done
+            self._stage_n = k + 1
+
+            # staging이 다 찼거나 episode가 끝나면 한 번에 flush
+            if self._stage_n == self.stage_size or done:
+                self.flush()
+
+            a = int(a)
+            if a not in self.known_actions:
+                self.known_actions.add(a)
+                self._actions_dirty = True
+
+            loss_val = None
+            if len(self.replay) >= self.warmup:
+                loss_val = self._train_step()
+            return loss_val
 
     def _train_step(self):
         batch = self.replay.sample(self.batch_size)
 
-        states = self._to_tensor(batch["states"])
-        actions = batch["actions"]
-        rewards = self._to_tensor(batch["rewards"])
-        next_states = self._to_tensor(batch["next_states"])
-        dones = self._to_tensor(batch["dones"])
+        states = batch["states"]
+        rewards = batch["rewards"]
+        next_states = batch["next_states"]
+        dones = batch["dones"]
 
-        actions_t = self._action_to_tensor(actions)
+        actions_t = batch["actions"].float().mul_(self._scale_inv).unsqueeze(-1)
 
-        q_values = self.policy_net(states, actions_t).squeeze(-1)
+        with self._autocast():
+            q_values = self._policy_forward(self.policy_net, states, actions_t).squeeze(-1)
+        q_values = q_values.float()
 
         if len(self.known_actions) == 0:
             max_next_q = torch.zeros_like(rewards)
         else:
-            action_list = sorted(self.known_actions)
-            A = len(action_list)
-            B = next_states.shape[0]
-
-            actions_all = np.array(action_list, dtype=np.float32) / self.node_id_scale
-            actions_all_t = self._to_tensor(actions_all)
-            actions_all_t = actions_all_t.view(1, A).repeat(B, 1)
-            actions_all_t = actions_all_t.unsqueeze(-1).view(B * A, 1)
-
-            states_rep = next_states.unsqueeze(1).expand(B, A, self.state_dim)
-            states_rep = states_rep.reshape(B * A, self.state_dim)
-
-            with torch.no_grad():
-                q_all_policy = self.policy_net(states_rep, actions_all_t).view(B, A)
+            if self._actions_dirty:
+                # max / argmax는 순서와 무관하므로 정렬하지 않음
+                arr = np.fromiter(self.known_actions, dtype=np.float32, count=len(self.known_actions))
+                self._actions_tensor = torch.from_numpy(arr).to(self.device).mul_(self._scale_inv)
+                self._actions_dirty = False
+            actions_all_t = self._actions_tensor  # (A,)
+
+            # target 쪽은 역전파가 없으므로 inference_mode (targets는 바깥에서 계산되어 일반 텐서가 됨)
+            with torch.inference_mode(), self._autocast():
+                q_all_policy = self.policy_infer.forward_expanded(next_states, actions_all_t)  # (B, A)
                 best_idx = q_all_policy.argmax(dim=1)
 
-                q_all_target = self.target_net(states_rep, actions_all_t).view(B, A)
+                q_all_target = self.target_net.forward_expanded(next_states, actions_all_t)
                 max_next_q = q_all_target.gather(1, best_idx.unsqueeze(1)).squeeze(1)
+            max_next_q = max_next_q.float()
 
         targets = rewards + self.gamma * (1.0 - dones) * max_next_q
 
-        loss = nn.MSELoss()(q_values, targets)
+        loss = F.mse_loss(q_values, targets)
 
-        self.optimizer.zero_grad()
+        self.optimizer.zero_grad(set_to_none=True)
         loss.backward()
         nn.utils.clip_grad_norm_(self.policy_net.parameters(), 5.0)
         self.optimizer.step()
 
         self.train_step_count += 1
-        self.last_loss = float(loss.item())
+        # .item()은 GPU 동기화를 일으키므로 0-d 텐서로 보관 (float 변환은 로깅 시점에)
+        self.last_loss = loss.detach()
 
         with torch.no_grad():
-            tau = self.tau
-            for target_param, param in zip(self.target_net.parameters(),
-                                           self.policy_net.parameters()):
-                target_param.data.mul_(1.0 - tau).add_(tau * param.data)
+            torch._foreach_mul_(self._target_params, 1.0 - self.tau)
+            torch._foreach_add_(self._target_params, self._policy_params, alpha=self.tau)
 
         return self.last_loss
 
+    def _state_to_device(self, s) -> torch.Tensor:
+        """(state_dim,) state -> self.device 텐서"""
+        s = np.asarray(s, dtype=np.float32)
+        # pinned staging에 스칼라/길이 1 배열이 broadcast되어 조용히 채워지지 않도록
+        if s.shape != (self.state_dim,):
+            raise ValueError(f"state shape {s.shape} != ({self.state_dim},)")
+        if self._pin_state is None:
+            return torch.from_numpy(s).to(self.device)
+        # 직전 비동기 복사가 끝난 뒤에 staging을 덮어씀
+        self._state_copy_done.synchronize()
+        self._pin_state_np[:] = s
+        s_t = self._pin_state.to(self.device, non_blocking=True)
+        self._state_copy_done.record()
+        return s_t
+
     def predict_q(self, s, a) -> float:
-        s_t = self._to_tensor(s).unsqueeze(0)
-        a_t = self._action_to_tensor([a])
-        with torch.no_grad():
-            q = self.policy_net(s_t, a_t).item()
+        with self.lock:
+            s_t = self._state_to_device(s).unsqueeze(0)
+            a_t = self._action_to_tensor([a])
+            with torch.inference_mode(), self._autocast():
+                q = self._policy_forward(self.policy_infer, s_t, a_t).float().item()
         return float(q)
 
+    @staticmethod
+    def _bucket(n: int) -> int:
+        """n 이상인 가장 작은 2의 거듭제곱 (컴파일된 forward의 shape 종류를 제한)."""
+        return 1 << (n - 1).bit_length()
+
+    def _build_cand_tensor(self, cand_key: bytes) -> torch.Tensor:
+        cand_ids = np.frombuffer(cand_key, dtype=np.int64)
+        n = len(cand_ids)
+        A = self._bucket(n) if self.compiled else n
+
+        ids = np.zeros(A, dtype=np.float32)  # 컴파일 시 bucket 크기까지 0으로 padding
+        ids[:n] = cand_ids
+        return torch.from_numpy(ids).to(self.device).mul_(self._scale_inv).unsqueeze_(-1)
+
+    def predict_q_batch_tensor(self, s, action_ids) -> torch.Tensor:
+        """
+        하나의 state s 에 대해 후보 action 전체의 Q(s, a)를 한 번의 forward로 계산.
+        - s: (state_dim,)  /  action_ids: (A,)
+        - 반환: (A,) float32 텐서 (self.device 위, argmax 등은 그대로 device에서)
+        """
+        action_ids = np.asarray(action_ids, dtype=np.int64)
+        n = len(action_ids)
+        with self.lock:
+            a_t = self._cand_tensor(action_ids.tobytes())  # (A, 1), A >= n
+            A = a_t.shape[0]
+
+            s_t = self._state_to_device(s)
+            s_t = s_t.unsqueeze(0).expand(A, -1)
+            with torch.inference_mode(), self._autocast():
+                q = self._policy_forward(self.policy_infer, s_t, a_t).squeeze(-1)
+            # lock 밖에서 읽으므로 복사본으로 (CUDA graph 출력 버퍼는 다음 재생 때 덮어써짐)
+            return q[:n].to(torch.float32, copy=True)
+
     def save(self, step_count: int):
         path = os.path.join(CHECKPOINT_DIR, f"dqn_step{step_count:07d}.pt")
-        torch.save(
-            {
+        # CPU 복사는 여기서 동기로 (이후 in-place 파라미터 업데이트와 경합 방지),
+        # torch.save(디스크 쓰기)만 백그라운드에서
+        with self.lock:
+            payload = {
                 "step": step_count,
-                "model_state": self.policy_net.state_dict(),
-                "optimizer_state": self.optimizer.state_dict(),
+                "model_state": _clone_to_cpu(self.policy_net.state_dict()),
+                "optimizer_state": _clone_to_cpu(self.optimizer.state_dict()),
                 "known_actions": list(self.known_actions),
-            },
-            path,
-        )
-        print(f"[PY] checkpoint saved: {path}")
+            }
+        self._save_executor.submit(self._write_checkpoint, payload, path)
+
+    @staticmethod
+    def _write_checkpoint(payload: dict, path: str):
+        try:
+            # main() 없이 learner만 쓰는 경우에도 저장되도록 여기서 디렉터리 생성
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            torch.save(payload, path)
+            print(f"[PY] checkpoint saved: {path}")
+        except Exception as e:
+            print(f"[PY] checkpoint save error: {e}")
+
+    def close(self):
+        """남은 체크포인트 저장이 끝날 때까지 대기."""
+        self._save_executor.shutdown(wait=True)
+
+
+# ==============================
+#  백그라운드 학습
+# ==============================
+class TrainWorker:
+    """
+    transition 저장 + 학습(learner.observe)을 백그라운드 스레드에서 처리.
+    - submit(): 큐에 넣고 바로 반환 (소켓 스레드는 Unity 응답만 담당)
+                큐가 가득 차면 (학습이 밀리는 경우) 빈 자리가 날 때까지 대기
+    - drain(): 큐에 쌓인 transition이 모두 학습될 때까지 대기
+    - pop_loss_stats(): 지난 호출 이후 학습 loss 합계/횟수 (episode 요약용, drain() 후 호출)
+    - close(): 남은 transition을 모두 처리하고 스레드 종료
+    """
+    def __init__(self, learner: "DqnLearner", maxsize: int = 1024):
+        self.learner = learner
+        self.transition_q = queue.Queue(maxsize=maxsize)
+        self._stats_lock = threading.Lock()
+        self._loss_sum = 0.0
+        self._loss_count = 0
+        self._thread = threading.Thread(target=self._run, name="train-worker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self.transition_q.get()
+            if item is None:
+                self.transition_q.task_done()
+                return
+            try:
+                loss_val = self.learner.observe(*item)
+                if loss_val is not None:
+                    with self._stats_lock:
+                        self._loss_sum += loss_val  # device 텐서 그대로 누적 (동기화 없음)
+                        self._loss_count += 1
+            except Exception as e:
+                print(f"[PY] train step error: {e}")
+            finally:
+                self.transition_q.task_done()
+
+    def submit(self, s, a, r, s_next, done=False):
+        self.transition_q.put((s, a, r, s_next, done))
+
+    def drain(self):
+        self.transition_q.join()
+
+    def pop_loss_stats(self):
+        with self._stats_lock:
+            stats = (self._loss_sum, self._loss_count)
+            self._loss_sum = 0.0
+            self._loss_count = 0
+        return stats
+
+    def close(self):
+        self.transition_q.put(None)
+        self._thread.join()
+
+
+def _clone_to_cpu(obj):
+    """state_dict 안의 텐서들을 CPU로 복제 (dict/list/tuple 재귀)."""
+    if torch.is_tensor(obj):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return {k: _clone_to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_clone_to_cpu(v) for v in obj)
+    return obj
 
 
 # ==============================
@@ -280,13 +681,98 @@ def epsilon_by_episode(
     return max(eps_min, float(eps))
 
 
+# ==============================
+#  Unity 메시지 인코딩 / 디코딩
+# ==============================
+def decode_state(msg: dict, key: str) -> np.ndarray:
+    """
+    msg 안의 state 벡터를 float32 배열로.
+    - "<key>_b64": little-endian float32 바이트를 base64로 보낸 경우 (원소별 변환 없이 frombuffer)
+    - "<key>": float 리스트 (fromiter)
+    """
+    b64 = msg.get(key + "_b64")
+    if b64 is not None:
+        return np.frombuffer(bytearray(base64.b64decode(b64)), dtype="<f4")
+    values = msg.get(key, [])
+    return np.fromiter(values, dtype=np.float32, count=len(values))
+
+
+# 고정된 key 부분은 미리 bytes로 만들어 두고 값만 채움 (dict 생성 + 전체 직렬화 생략)
+_ACTION_REPLY_PREFIX = b'{"type":"action_reply","chosen_node_id":'
+_Q_UPDATE_FORMAT = b'{"type":"q_update","node_ids":[%d],"q_values":[%b]}\n'
+
+
+def encode_action_reply(chosen_node_id: int, cand_ids, q_values, epsilon: float, is_random: bool) -> bytes:
+    """action_reply 한 줄 (개행 포함). cand_ids / q_values 는 numpy 배열 그대로."""
+    return b"".join((
+        _ACTION_REPLY_PREFIX, b"%d" % chosen_node_id,
+        b',"candidate_node_ids":', orjson.dumps(cand_ids, option=orjson.OPT_SERIALIZE_NUMPY),
+        b',"q_values":', orjson.dumps(q_values, option=orjson.OPT_SERIALIZE_NUMPY),
+        b',"epsilon":', orjson.dumps(float(epsilon)),
+        b',"is_random":', b"true" if is_random else b"false",
+        b"}\n",
+    ))
+
+
+def encode_q_update(node_id: int, q_value: float) -> bytes:
+    """q_update 한 줄 (개행 포함)."""
+    return _Q_UPDATE_FORMAT % (node_id, orjson.dumps(float(q_value)))
+
+
+def iter_lines(rf, wf):
+    """
+    rf에서 line 단위로 읽는 generator.
+    새 데이터를 기다리기(블로킹) 직전에만 wf를 flush 해서,
+    한 번에 도착한 메시지들에 대한 reply는 write syscall 한 번으로 묶어 보낸다.
+    """
+    buf = bytearray()
+    while True:
+        try:
+            wf.flush()
+        except OSError as e:
+            print(f"[PY] reply send error: {e}")
+        chunk = rf.read1(65536)
+        if not chunk:
+            return
+        # 기존 buf에는 '\n'이 없으므로 새로 붙은 부분부터만 탐색 (긴 line도 재복사/재탐색 없음)
+        scan = len(buf)
+        buf += chunk
+        start = 0
+        while True:
+            nl = buf.find(b"\n", scan)
+            if nl < 0:
+                break
+            yield bytes(buf[start:nl])
+            start = scan = nl + 1
+        if start:
+            del buf[:start]  # 처리한 line은 read 한 번당 한 번만 잘라냄
+
+
 # ==============================
 #  TCP 서버 + 학습 루프
 # ==============================
 def main():
+    # CPU: 작은 MLP의 단건 추론은 thread team 기동 비용이 더 큼 → 단일 스레드
+    # (set_num_interop_threads는 병렬 작업 시작 전 한 번만 호출 가능)
+    if not torch.cuda.is_available():
+        torch.set_num_threads(1)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError as e:
+            print(f"[PY] set_num_interop_threads skipped: {e}")
+    elif hasattr(torch, "compile"):
+        # CUDA (torch.compile 사용): shape별 재컴파일 허용 수 (기본 8, 프로세스 전역)
+        # 학습 batch + 추론 bucket(1, 2, 4, ..., 64, ...) x grad/inference 모드 조합이
+        # 기본값을 넘으면 조용히 eager로 떨어지므로 넉넉히
+        # (recompile_limit은 예전 버전의 cache_size_limit)
+        dynamo_cfg = torch._dynamo.config
+        limit_name = "recompile_limit" if hasattr(dynamo_cfg, "recompile_limit") else "cache_size_limit"
+        setattr(dynamo_cfg, limit_name, max(getattr(dynamo_cfg, limit_name), 32))
+
     step_count = 0
     state_dim = None
     learner = None
+    trainer = None
 
     # ---- 에피소드 관리용 변수 ----
     episode_idx = 1
@@ -296,8 +782,6 @@ def main():
     # ✅ 에피소드 기반 추가 통계
     episode_q_sum = 0.0
     episode_q_count = 0
-    episode_loss_sum = 0.0
-    episode_loss_count = 0
     episode_random_count = 0
 
     # 🔹 한 에피소드 = 30 step
@@ -308,32 +792,37 @@ def main():
     # 로깅용: 실제 사용 epsilon
     latest_epsilon_used = None
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(1)
-        print(f"[PY] Listening on {HOST}:{PORT} ...")
-
-        conn, addr = s.accept()
-        print(f"[PY] Connected by {addr}")
-
-        with conn:
-            buf = b""
-            while True:
-                data = conn.recv(4096)
-                if not data:
-                    print("[PY] Connection closed.")
-                    break
-
-                buf += data
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
+    init_wandb()
+    # per-step W&B 로깅은 백그라운드 스레드로
+    wb_logger = WandbLogger()
+
+    # 연결이 비정상 종료(broken pipe 등)돼도 학습 스레드/체크포인트 저장은 정리
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            # 수신 버퍼 256KB (accept된 conn이 그대로 물려받음)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 256 * 1024)
+            s.bind((HOST, PORT))
+            s.listen(1)
+            print(f"[PY] Listening on {HOST}:{PORT} ...")
+
+            conn, addr = s.accept()
+            print(f"[PY] Connected by {addr}")
+
+            # 작은 메시지를 바로 보내도록 Nagle 끔
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            # 송수신 모두 버퍼링된 파일 객체로 (reply는 다음 수신 대기 직전에 한 번에 flush)
+            with conn, conn.makefile("rb", buffering=65536) as rf, conn.makefile("wb", buffering=65536) as wf:
+                for line in iter_lines(rf, wf):
                     line = line.strip()
+                    if line.startswith(b"\xef\xbb\xbf"):  # UTF-8 BOM
+                        line = line[3:]
                     if not line:
                         continue
 
                     try:
-                        msg = json.loads(line.decode("utf-8-sig"))
+                        msg = orjson.loads(line)
                     except Exception as e:
                         print(f"[PY] JSON parse error: {e}, line={line[:200]}")
                         continue
@@ -344,22 +833,27 @@ def main():
                     # 1) 액션 요청 처리
                     # ==============================
                     if msg_type == "action_request":
-                        state_list = msg.get("state", [])
-                        cand_ids = msg.get("candidate_node_ids", [])
+                        try:
+                            s_t = decode_state(msg, "state")
+                        except (ValueError, TypeError) as e:  # binascii.Error도 ValueError
+                            print(f"[PY] bad state payload (action_request): {e}")
+                            continue
+                        cand_ids = np.asarray(msg.get("candidate_node_ids", []), dtype=np.int64)
 
                         # Unity에서 넘어온 epsilon (참고용)
                         base_epsilon_unity = float(msg.get("epsilon", 0.1))
                         latest_base_epsilon_unity = base_epsilon_unity
 
-                        if len(state_list) == 0 or len(cand_ids) == 0:
+                        if len(s_t) == 0 or len(cand_ids) == 0:
                             print("[PY] action_request: 빈 state 또는 candidate_node_ids")
                             continue
 
-                        s_t = np.array(state_list, dtype=np.float32)
-
                         if state_dim is None:
                             state_dim = s_t.shape[0]
                             print(f"[PY] 첫 state 수신 (action_request). state_dim={state_dim}")
+                        elif s_t.size != state_dim:
+                            print(f"[PY] bad state payload (action_request): size={s_t.size}, state_dim={state_dim}")
+                            continue
 
                         if learner is None:
                             learner = DqnLearner(
@@ -372,16 +866,12 @@ def main():
                                 target_update_interval=1_000,
                             )
 
-                        cand_ids = [int(x) for x in cand_ids]
-
-                        # 후보들 Q(s,a)
-                        q_values = []
-                        for nid in cand_ids:
-                            try:
-                                q_values.append(learner.predict_q(s_t, nid))
-                            except Exception as e:
-                                print(f"[PY] predict_q error for node_id={nid}: {e}")
-                                q_values.append(0.0)
+                        # 후보들 Q(s,a) (한 번의 batched forward)
+                        try:
+                            q_values_t = learner.predict_q_batch_tensor(s_t, cand_ids)
+                        except Exception as e:
+                            print(f"[PY] predict_q_batch error: {e}")
+                            q_values_t = torch.zeros(len(cand_ids))
 
                         # ✅ episode 기반 epsilon 사용
                         epsilon = epsilon_by_episode(
@@ -392,46 +882,35 @@ def main():
                         )
                         latest_epsilon_used = epsilon
 
-                        # ε-greedy
-                        rand_val = np.random.rand()
+                        # ε-greedy (argmax는 device 텐서에서 바로)
+                        rand_val = learner.rng.random()
                         if rand_val < epsilon:
-                            idx = np.random.randint(len(cand_ids))
+                            idx = int(learner.rng.integers(len(cand_ids)))
                             is_random = True
                         else:
-                            idx = int(np.argmax(q_values))
+                            idx = int(q_values_t.argmax().item())
                             is_random = False
 
+                        # reply용으로만 CPU로 가져옴
+                        q_values = q_values_t.cpu().numpy()
+
                         if is_random:
                             episode_random_count += 1
 
                         chosen_node_id = int(cand_ids[idx])
 
-                        reply = {
-                            "type": "action_reply",
-                            "chosen_node_id": chosen_node_id,
-                            "candidate_node_ids": cand_ids,
-                            "q_values": [float(q) for q in q_values],
-                            "epsilon": float(epsilon),         # Unity로도 전달 (표시/디버그용)
-                            "is_random": bool(is_random),
-                        }
+                        # epsilon은 Unity로도 전달 (표시/디버그용)
+                        reply = encode_action_reply(chosen_node_id, cand_ids, q_values, epsilon, is_random)
 
                         try:
-                            conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+                            wf.write(reply)
                             if episode_step == 0:
-                                print(f"[PY] === Episode {episode_idx} 시작 === (epsilon={epsilon:.3f})")
-                            print(f"[PY] action_reply: chosen={chosen_node_id}, eps={epsilon:.3f}, random={is_random}")
+                                wb_logger.log_text(f"[PY] === Episode {episode_idx} 시작 === (epsilon={epsilon:.3f})")
+                            wb_logger.log_text(f"[PY] action_reply: chosen={chosen_node_id}, eps={epsilon:.3f}, random={is_random}")
                         except Exception as e:
                             print(f"[PY] action_reply send error: {e}")
 
-                        # per-step로도 epsilon 로깅 (선택된 epsilon 확인용)
-                        wandb.log(
-                            {
-                                "env_step": step_count,
-                                "train/epsilon_used": float(latest_epsilon_used),
-                                "train/base_epsilon_unity": float(latest_base_epsilon_unity),
-                            }
-                        )
-
+                        # epsilon은 다음 transition의 per-step 로그에 같이 실림
                         continue
 
                     # ==============================
@@ -442,8 +921,20 @@ def main():
                         node_id = int(msg.get("node_id", -1))
                         reward = float(msg.get("reward", 0.0))
 
-                        s_t = np.array(msg.get("state_t", []), dtype=np.float32)
-                        s_tp1 = np.array(msg.get("state_tp1", []), dtype=np.float32)
+                        try:
+                            s_t = decode_state(msg, "state_t")
+                            s_tp1 = decode_state(msg, "state_tp1")
+                        except (ValueError, TypeError) as e:  # binascii.Error도 ValueError
+                            print(f"[PY] bad state payload (transition): {e}")
+                            continue
+
+                        expected_dim = state_dim if state_dim is not None else s_t.size
+                        if expected_dim == 0 or s_t.size != expected_dim or s_tp1.size != expected_dim:
+                            print(
+                                f"[PY] bad state payload (transition): "
+                                f"size={s_t.size}/{s_tp1.size}, state_dim={state_dim}"
+                            )
+                            continue
 
                         if state_dim is None:
                             state_dim = s_t.shape[0]
@@ -459,6 +950,8 @@ def main():
                                 warmup=500,
                                 target_update_interval=1_000,
                             )
+                        if trainer is None:
+                            trainer = TrainWorker(learner)
 
                         # ---- 전역 step ----
                         step_count += 1
@@ -469,7 +962,8 @@ def main():
 
                         done = (episode_step >= MAX_STEPS_PER_EPISODE)
 
-                        loss_val = learner.observe(s_t, node_id, reward, s_tp1, done=done)
+                        # 저장 + 학습은 TrainWorker 스레드에서 (소켓 스레드는 바로 q_update 응답)
+                        trainer.submit(s_t, node_id, reward, s_tp1, done=done)
 
                         # q_est
                         try:
@@ -482,20 +976,16 @@ def main():
                         episode_q_sum += float(q_est)
                         episode_q_count += 1
 
-                        if loss_val is not None:
-                            episode_loss_sum += float(loss_val)
-                            episode_loss_count += 1
-
                         # Unity로 q_update
-                        q_msg = {
-                            "type": "q_update",
-                            "node_ids": [int(node_id)],
-                            "q_values": [float(q_est)],
-                        }
+                        q_msg = encode_q_update(node_id, q_est)
 
                         try:
-                            conn.sendall((json.dumps(q_msg) + "\n").encode("utf-8"))
-                            print(
+                            wf.write(q_msg)
+                            # episode 종료/체크포인트 step은 뒤에 느린 작업(drain, wandb.log, save)이 있으므로
+                            # 다음 수신 대기까지 미루지 않고 바로 보냄
+                            if done or step_count % CHECKPOINT_INTERVAL == 0:
+                                wf.flush()
+                            wb_logger.log_text(
                                 f"[PY] step={step_count} | episode={episode_idx} "
                                 f"step={episode_step}/{MAX_STEPS_PER_EPISODE} : "
                                 f"action_id={action_id}, node_id={node_id}, reward={reward:+.3f}"
@@ -505,16 +995,17 @@ def main():
 
                         if step_count <= 3:
                             head = 12
-                            print(f"      s_t[0:{head}]   = {s_t[:head]}")
-                            print(f"      s_tp1[0:{head}] = {s_tp1[:head]}")
+                            # 위 step 헤더와 같은 큐로 보내 출력 순서 유지
+                            wb_logger.log_text(f"      s_t[0:{head}]   = {s_t[:head]}")
+                            wb_logger.log_text(f"      s_tp1[0:{head}] = {s_tp1[:head]}")
 
-                        # per-step W&B
-                        wandb.log(
+                        # per-step W&B (백그라운드 스레드에서 전송)
+                        wb_logger.log(
                             {
                                 "env_step": step_count,
                                 "train/reward": reward,
                                 "train/q_est": float(q_est),
-                                "train/loss": float(loss_val) if loss_val is not None else 0.0,
+                                "train/loss": learner.last_loss if learner.last_loss is not None else 0.0,
                                 "train/done_flag": float(done),
                                 "train/epsilon_used": float(latest_epsilon_used) if latest_epsilon_used is not None else 0.0,
                                 "train/base_epsilon_unity": float(latest_base_epsilon_unity) if latest_base_epsilon_unity is not None else 0.0,
@@ -524,15 +1015,22 @@ def main():
 
                         # ---- episode 종료 처리 ----
                         if done:
+                            # 이 episode의 transition(done 포함)이 모두 학습된 뒤에 loss 집계
+                            trainer.drain()
+                            episode_loss_sum, episode_loss_count = trainer.pop_loss_stats()
                             avg_reward = episode_return / float(max(1, episode_step))
                             avg_q = episode_q_sum / float(max(1, episode_q_count))
-                            avg_loss = (episode_loss_sum / float(episode_loss_count)) if episode_loss_count > 0 else 0.0
+                            avg_loss = float(episode_loss_sum / episode_loss_count) if episode_loss_count > 0 else 0.0
                             random_rate = episode_random_count / float(MAX_STEPS_PER_EPISODE)
 
+                            # 쌓인 per-step 로그/출력을 먼저 내보낸 뒤 episode 요약은 동기로
+                            wb_logger.flush()
+
                             print(
                                 f"[PY] === Episode {episode_idx} done === "
                                 f"(len={episode_step}, return={episode_return:+.3f}, avg_reward={avg_reward:+.3f}, "
-                                f"avg_q={avg_q:+.3f}, avg_loss={avg_loss:.6f}, random_rate={random_rate:.2f})"
+                                f"avg_q={avg_q:+.3f}, avg_loss={avg_loss:.6f}, random_rate={random_rate:.2f}, "
+                                f"log_dropped={wb_logger.dropped})"
                             )
 
                             # per-episode W&B
@@ -557,8 +1055,6 @@ def main():
                             # episode 통계 리셋
                             episode_q_sum = 0.0
                             episode_q_count = 0
-                            episode_loss_sum = 0.0
-                            episode_loss_count = 0
                             episode_random_count = 0
 
                         # ---- 체크포인트 저장 ----
@@ -569,6 +1065,14 @@ def main():
 
                     print(f"[PY] Unknown msg type: {msg_type}")
 
+                print("[PY] Connection closed.")
+    finally:
+        if trainer is not None:
+            trainer.close()
+        wb_logger.flush()
+        if learner is not None:
+            learner.close()
+
 
 if __name__ == "__main__":
     main()